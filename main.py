@@ -6,30 +6,188 @@ S3 Sync Script - высокопроизводительное копирован
 """
 
 import asyncio
+import gc
+import json
 import os
 import sys
 import mimetypes
+import shlex
+import shutil
 import signal
-from typing import Dict, List, Tuple, Optional
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Tuple, Optional
 
 import aioboto3
 import urllib3
 from aiobotocore.config import AioConfig
+from boto3.s3.transfer import TransferConfig
 from botocore.exceptions import ClientError
 from dotenv import load_dotenv
 from tqdm.asyncio import tqdm
 
+try:
+    # Event loop на libuv: меньше накладных расходов на каждый await
+    import uvloop
+except ImportError:  # Windows или пакет не установлен
+    uvloop = None
+
 # Подавление предупреждений SSL
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
-# Инициализация MIME-типов
-mimetypes.init()
+DEFAULT_MIME_TYPE = 'application/octet-stream'
 
 # Константы производительности
 DEFAULT_CONCURRENCY = 150  # Оптимальное значение для большинства случаев
-MAX_POOL_CONNECTIONS = 100  # Пул соединений
-CHUNK_SIZE = 8 * 1024 * 1024  # 8 MB
-MAX_FILE_SIZE_IN_MEMORY = 10 * 1024 * 1024  # 10 MB - лимит для памяти
+CONNECT_TIMEOUT = 5  # Секунд на установку соединения
+READ_TIMEOUT = 60  # Секунд на чтение ответа
+MAX_RETRY_ATTEMPTS = 10  # Попыток на запрос (adaptive retry)
+PROGRESS_INTERVAL = 0.5  # Секунд между обновлениями прогресс-бара
+LOG_BATCH = 100  # Сообщений в одном выводе tqdm.write
+MANIFEST_FLUSH_EVERY = 1000  # Сброс манифеста на диск каждые N файлов
+CHUNK_SIZE = 8 * 1024 * 1024  # 8 MB - минимальная часть multipart upload
+MULTIPART_THRESHOLD = CHUNK_SIZE  # До одной части - один PutObject
+MIN_PART_SIZE = 5 * 1024 * 1024  # 5 MB - лимит S3 на размер части
+MAX_PART_SIZE = 5 * 1024 * 1024 * 1024  # 5 GB - лимит S3 на размер части
+MAX_PARTS = 10000  # Лимит S3 на количество частей
+PART_SIZE_MB = 50  # Размер части крупных файлов (S3_PART_SIZE_MB)
+PART_CONCURRENCY = 8  # Параллельных частей одного объекта
+PART_MEMORY_LIMIT = 1024 * 1024 * 1024  # 1 GB - на части в памяти
+LIST_CONCURRENCY = 16  # Параллельно листающихся префиксов одного бакета
+AUTO_LIST_PREFIXES = 64  # LIST_PREFIXES=auto: больше папок - без шардинга
+MIN_POOL_CONNECTIONS = 64  # Минимальный размер пула соединений клиента
+SKIP_HEAD_BELOW_BYTES = 64 * 1024  # 64 KB - без индекса копируем без HEAD
+THROTTLE_RETRIES = 3  # Повторов объекта после исчерпания retry botocore
+MAX_BACKOFF = 30  # Секунд - максимальная общая пауза при троттлинге
+THROTTLE_DECAY = 60  # Секунд без троттлинга, за которые пауза вдвое короче
+# Коды ответа, при которых хранилище просит снизить частоту запросов
+THROTTLE_CODES = frozenset((
+    'SlowDown',
+    'RequestTimeout',
+    'ServiceUnavailable',
+    '503',
+    'Throttling',
+    'ThrottlingException',
+    'RequestLimitExceeded',
+))
+
+# Серверное копирование (CopyObject / UploadPartCopy)
+# Крупные объекты копируются параллельными UploadPartCopy
+MULTIPART_COPY_THRESHOLD = 64 * 1024 * 1024  # 64 MB
+# Ответы на условные запросы с If-None-Match по ETag назначения
+# (содержимое источника уже совпадает с назначением): GET отвечает 304,
+# CopyObject с CopySourceIfNoneMatch - 412
+NOT_MODIFIED_CODES = frozenset(('NotModified', '304'))
+COPY_NOT_MODIFIED_CODES = frozenset(('PreconditionFailed', '412'))
+# Коды ошибок, при которых серверное копирование невозможно
+# (разные аккаунты, провайдер не поддерживает CopyObject)
+SERVER_COPY_UNSUPPORTED = ('AccessDenied', 'NotImplemented')
+
+
+# Таблицы MIME-типов, строятся при первом обращении (_mime_tables)
+_ext_to_mime: Optional[Dict[str, str]] = None
+_compound_suffixes: frozenset = frozenset()
+
+
+def _mime_tables() -> Tuple[Dict[str, str], frozenset]:
+    """
+    Таблица расширение -> MIME-тип и суффиксы сжатия (.gz, .tgz...)
+
+    mimetypes.init() читает системные mime.types, поэтому выполняется
+    только когда MIME-тип действительно понадобился, и один раз.
+    """
+    global _ext_to_mime, _compound_suffixes
+    if _ext_to_mime is None:
+        mimetypes.init()
+        # Значения уже нормализованы
+        _ext_to_mime = {
+            ext: mime.lower().strip()
+            for ext, mime in mimetypes.types_map.items()
+        }
+        # Для суффиксов сжатия MIME зависит от двойного расширения
+        _compound_suffixes = frozenset(mimetypes.suffix_map) | frozenset(
+            mimetypes.encodings_map
+        )
+    return _ext_to_mime, _compound_suffixes
+
+
+def _mime(key: str) -> str:
+    """
+    MIME-тип по расширению ключа (нормализованный)
+
+    Результат совпадает с mimetypes.guess_type, но для обычных расширений
+    это один поиск в словаре вместо разбора ключа на каждый объект.
+    """
+    dot = key.rfind('.')
+    if dot <= key.rfind('/'):
+        return DEFAULT_MIME_TYPE
+
+    ext_to_mime, compound_suffixes = _mime_tables()
+    ext = key[dot:]
+    if ext in compound_suffixes or ext.lower() in compound_suffixes:
+        mime, _ = mimetypes.guess_type(key)
+        return mime.lower().strip() if mime else DEFAULT_MIME_TYPE
+
+    return (
+        ext_to_mime.get(ext)
+        or ext_to_mime.get(ext.lower())
+        or DEFAULT_MIME_TYPE
+    )
+
+
+def _part_size(size: int, minimum: int = CHUNK_SIZE) -> int:
+    """Размер части, при котором объект укладывается в MAX_PARTS частей"""
+    min_part = -(-size // MAX_PARTS)
+    return max(minimum, -(-min_part // (1024 * 1024)) * 1024 * 1024)
+
+
+async def _read_part(body, size: int) -> bytes:
+    """
+    Чтение ровно size байт из потока (меньше - только в конце)
+
+    StreamingBody.read() возвращает столько, сколько уже пришло по сети,
+    а части multipart upload (кроме последней) должны быть не меньше 5 MB.
+    """
+    chunks = []
+    remaining = size
+    while remaining > 0:
+        chunk = await body.read(remaining)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b''.join(chunks)
+
+
+class _Interrupted(Exception):
+    """Копирование объекта прервано остановкой (Ctrl+C, SIGTERM)"""
+
+
+async def _gather_or_cancel(*coros) -> list:
+    """asyncio.gather, который отменяет остальные задачи при ошибке одной"""
+    tasks = [asyncio.ensure_future(coro) for coro in coros]
+    try:
+        return await asyncio.gather(*tasks)
+    except (Exception, asyncio.CancelledError):
+        for task in tasks:
+            task.cancel()
+        raise
+
+
+_session: Optional[aioboto3.Session] = None
+
+
+def _get_session() -> aioboto3.Session:
+    """
+    Общая сессия aioboto3 для всех S3Syncer в процессе
+
+    Сессия кеширует загруженную модель сервиса S3, поэтому повторное
+    создание клиентов (несколько запусков sync из одного процесса)
+    не разбирает её заново.
+    """
+    global _session
+    if _session is None:
+        _session = aioboto3.Session()
+    return _session
 
 
 class S3Syncer:
@@ -38,8 +196,9 @@ class S3Syncer:
     def __init__(self):
         load_dotenv()
 
-        self.interrupted = False
-        self._setup_signal_handlers()
+        # Кооперативная остановка: воркеры проверяют событие перед
+        # каждым объектом, паузы троттлинга прерываются им сразу
+        self.stop = asyncio.Event()
         self._validate_env()
 
         # Настройки
@@ -47,40 +206,134 @@ class S3Syncer:
         self.target_bucket = os.getenv('TARGET_BUCKET_NAME')
         self.concurrency = int(os.getenv('MAX_WORKERS', DEFAULT_CONCURRENCY))
 
+        # Части multipart: размер (в пределах лимитов S3) и параллельность
+        part_size_mb = self._positive_int_env('S3_PART_SIZE_MB', PART_SIZE_MB)
+        self.part_size = min(
+            MAX_PART_SIZE,
+            max(MIN_PART_SIZE, part_size_mb * 1024 * 1024)
+        )
+        self.part_concurrency = self._positive_int_env(
+            'S3_PART_CONCURRENCY', PART_CONCURRENCY
+        )
+
         # Конфигурация с пулом соединений
-        # Автоматически подстраиваем под MAX_WORKERS
-        pool_size = min(self.concurrency, MAX_POOL_CONNECTIONS)
+        # Пул рассчитан на одновременные запросы: MAX_WORKERS операций,
+        # части multipart (бюджет PART_MEMORY_LIMIT вмещает не больше
+        # 128 частей, меньше MAX_WORKERS по умолчанию) и листинг - каждый
+        # получает свое keep-alive соединение без нового TCP/TLS рукопожатия
+        min_pool_size = max(
+            MIN_POOL_CONNECTIONS,
+            2 * self.concurrency + LIST_CONCURRENCY
+        )
+        pool_size = max(
+            min_pool_size,
+            int(os.getenv('MAX_POOL_CONNECTIONS', min_pool_size))
+        )
         self.aio_config = AioConfig(
             max_pool_connections=pool_size,
-            connect_timeout=30,
-            read_timeout=60,
+            connect_timeout=CONNECT_TIMEOUT,
+            read_timeout=READ_TIMEOUT,
+            retries={'max_attempts': MAX_RETRY_ATTEMPTS, 'mode': 'adaptive'},
         )
 
         # Конфигурации клиентов
         self.source_config = self._build_config('SOURCE')
         self.target_config = self._build_config('TARGET')
 
+        # Серверное копирование: байты не проходят через клиента
+        self.server_side_copy = self._detect_server_side_copy()
+
+        # Проверка MIME-типа у файлов, совпадающих по размеру (HEAD)
+        self.verify_content_type = (
+            os.getenv('VERIFY_CONTENT_TYPE', 'true').lower() != 'false'
+        )
+
+        # Сравнение ETag однокомпонентных загрузок помимо размера
+        self.compare_etag = (
+            os.getenv('COMPARE_ETAG', 'true').lower() != 'false'
+        )
+
+        # Префиксы для параллельного листинга ('' - весь бакет,
+        # None - LIST_PREFIXES=auto, по папкам первого уровня). Пустые
+        # элементы и повторы отбрасываются: пустой префикс листал бы
+        # весь бакет еще раз поверх остальных
+        list_prefixes = os.getenv('LIST_PREFIXES', '').strip()
+        self.list_prefixes = list(dict.fromkeys(
+            prefix.strip() for prefix in list_prefixes.split(',')
+            if prefix.strip()
+        )) or ['']
+        if list_prefixes.lower() == 'auto':
+            self.list_prefixes = None
+
+        # Индекс целевого бакета: ключ -> (размер, ETag)
+        # (None - листинг назначения запрещен, проверка через HEAD)
+        self.target_index: Optional[Dict[str, Tuple[int, str]]] = {}
+
+        # Без индекса файлы меньше этого размера копируются без HEAD
+        self.skip_head_below = int(
+            os.getenv('SKIP_HEAD_BELOW_BYTES', SKIP_HEAD_BELOW_BYTES)
+        )
+
+        # Манифест: файлы, проверенные или скопированные прошлыми запусками
+        default_manifest = (
+            f'.s3rsync-{self.source_bucket}-{self.target_bucket}.done'
+        )
+        self.manifest_path = os.getenv('MANIFEST_FILE', default_manifest)
+        self.done: Dict[str, str] = {}
+        self.manifest = None
+        self.manifest_pending = 0
+
         # Статистика
         self.stats = {'total': 0, 'copied': 0, 'skipped': 0, 'errors': 0}
+        self.processed = 0
 
-        # Семафор для ограничения параллельных операций
-        self.semaphore = None
+        # Сообщения для вывода над прогресс-баром (без блокировки воркеров)
+        self.log_queue = asyncio.Queue()
+
+        # Бюджет памяти под части multipart upload: семафор в единицах
+        # CHUNK_SIZE и блокировка, чтобы часть занимала единицы целиком
+        self.part_semaphore = None
+        self.part_lock = None
+        self.target_indexed = None
+
+        # Общая пауза всех воркеров при троттлинге (время event loop)
+        self.throttle_level = 0
+        self.throttle_until = 0.0
+
+        # Процесс s5cmd (S3RSYNC_ACCEL=s5cmd) и ожидающие результата ключи
+        self.accel = None
+        self.accel_readers = []
+        self.accel_pending: Dict[str, str] = {}
 
         # Сессия aioboto3
-        self.session = aioboto3.Session()
+        self.session = _get_session()
 
     def _setup_signal_handlers(self):
-        """Настройка обработчиков сигналов"""
-        def handler(signum, frame):
-            if not self.interrupted:
-                self.interrupted = True
-                print("\n\n⚠️  Прерывание... Завершаю текущие операции...")
-            else:
-                print("\n❌ Принудительная остановка!")
-                sys.exit(130)
+        """
+        Настройка обработчиков сигналов
 
-        signal.signal(signal.SIGINT, handler)
-        signal.signal(signal.SIGTERM, handler)
+        Обработчик выполняется в event loop между задачами, а не посреди
+        чужого await. На Windows add_signal_handler недоступен - там
+        сигнал передается в loop через call_soon_threadsafe.
+        """
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(signum, self._on_signal)
+            except NotImplementedError:
+                signal.signal(
+                    signum,
+                    lambda *_: loop.call_soon_threadsafe(self._on_signal)
+                )
+
+    def _on_signal(self) -> None:
+        """Первый сигнал - мягкая остановка, повторный - немедленная"""
+        if not self.stop.is_set():
+            self.stop.set()
+            print("\n\n⚠️  Прерывание... Завершаю текущие операции...")
+        else:
+            print("\n❌ Принудительная остановка!")
+            sys.exit(130)
 
     def _validate_env(self):
         """Проверка переменных окружения"""
@@ -93,6 +346,14 @@ class S3Syncer:
         if missing:
             raise ValueError(f"Отсутствуют: {', '.join(missing)}")
 
+    @staticmethod
+    def _positive_int_env(name: str, default: int) -> int:
+        """Целое положительное значение переменной окружения"""
+        value = os.getenv(name, str(default)).strip()
+        if not value.isdigit() or int(value) <= 0:
+            raise ValueError(f"{name} должно быть целым числом больше 0")
+        return int(value)
+
     def _build_config(self, prefix: str) -> dict:
         """Создание конфигурации клиента"""
         config = {
@@ -112,226 +373,934 @@ class S3Syncer:
 
         return config
 
-    async def get_all_objects(self) -> List[Dict]:
-        """Получение списка всех объектов (асинхронно)"""
-        objects = []
+    def _detect_server_side_copy(self) -> bool:
+        """
+        Определение возможности серверного копирования
 
-        print(f"📋 Получение списка файлов из {self.source_bucket}...")
+        SERVER_SIDE_COPY=auto (по умолчанию) включает его, когда источник
+        и назначение находятся на одном endpoint.
+        """
+        mode = os.getenv('SERVER_SIDE_COPY', 'auto').lower()
+        if mode in ('true', 'false'):
+            return mode == 'true'
+        return (
+            self.source_config.get('endpoint_url')
+            == self.target_config.get('endpoint_url')
+        )
 
-        async with self.session.client('s3', **self.source_config) as client:
-            paginator = client.get_paginator('list_objects_v2')
+    async def _iter_pages(
+        self,
+        client,
+        bucket: str
+    ) -> AsyncIterator[List[Dict]]:
+        """
+        Страницы list_objects_v2 по всем префиксам из LIST_PREFIXES
 
-            async for page in paginator.paginate(Bucket=self.source_bucket):
-                if 'Contents' in page:
-                    objects.extend(page['Contents'])
+        Префиксы обходятся параллельно (каждый - своим пагинатором на общем
+        клиенте, не больше LIST_CONCURRENCY одновременно), страницы
+        отдаются по мере получения. При LIST_PREFIXES=auto префиксами
+        служат папки первого уровня, найденные листингом с Delimiter='/'.
+        """
+        pages = asyncio.Queue(maxsize=LIST_CONCURRENCY)
+        limit = asyncio.Semaphore(LIST_CONCURRENCY)
+
+        async def walk(prefix: str):
+            async with limit:
+                paginator = client.get_paginator('list_objects_v2')
+                async for page in paginator.paginate(
+                    Bucket=bucket,
+                    Prefix=prefix
+                ):
+                    await pages.put(page.get('Contents', []))
+
+                    if self.stop.is_set():
+                        break
+
+        async def walk_auto():
+            # Корень с Delimiter='/' - один запрос: файлы из корня
+            # отдаются сразу, каждая папка обходится отдельно
+            root = await client.list_objects_v2(Bucket=bucket, Delimiter='/')
+            folders = [
+                common['Prefix'] for common in root.get('CommonPrefixes', [])
+            ]
+            if root.get('IsTruncated') or len(folders) > AUTO_LIST_PREFIXES:
+                # Широкий бакет (папка на пользователя и т.п.): запрос
+                # на каждую папку дороже, чем один общий пагинатор
+                await walk('')
+                return
+            await pages.put(root.get('Contents', []))
+            await _gather_or_cancel(*(walk(prefix) for prefix in folders))
+
+        async def walk_all():
+            try:
+                if self.list_prefixes is None:
+                    await walk_auto()
+                else:
+                    await _gather_or_cancel(
+                        *(walk(prefix) for prefix in self.list_prefixes)
+                    )
+            except Exception:
+                # Ошибку читатель получит из await walker
+                await pages.put(None)
+                raise
+            await pages.put(None)
 
-                if self.interrupted:
-                    break
+        walker = asyncio.create_task(walk_all())
+        try:
+            while (contents := await pages.get()) is not None:
+                yield contents
+            # Пробрасываем ошибку листинга, если она была
+            await walker
+        finally:
+            walker.cancel()
+
+    async def _index_target(self, client) -> None:
+        """
+        Индекс целевого бакета: ключ -> (размер, ETag)
 
-        print(f"✅ Найдено файлов: {len(objects):,}")
-        return objects
+        Один LIST возвращает до 1000 объектов, поэтому проверка
+        существования не требует HEAD-запроса на каждый файл.
+        Воркеры ждут target_indexed перед первой проверкой.
+        """
+        self.log_queue.put_nowait(
+            f"📋 Индексация целевого бакета {self.target_bucket}..."
+        )
 
-    async def check_target_exists(
+        try:
+            async for contents in self._iter_pages(client, self.target_bucket):
+                for obj in contents:
+                    self.target_index[obj['Key']] = (
+                        obj['Size'], obj.get('ETag', '')
+                    )
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'AccessDenied':
+                raise
+            # Нет права s3:ListBucket на назначение - проверка HEAD-запросами
+            self.target_index = None
+            self.log_queue.put_nowait(
+                f"⚠️  Нет доступа к списку файлов {self.target_bucket}, "
+                f"проверка HEAD-запросами"
+            )
+        else:
+            self.log_queue.put_nowait(
+                f"✅ В целевом бакете файлов: {len(self.target_index):,}"
+            )
+        # Индекс больше не меняется: убираем его (и клиентов) из обхода
+        # сборщика мусора, иначе каждая полная сборка проходит миллионы
+        # кортежей индекса
+        gc.freeze()
+        self.target_indexed.set()
+
+    def _load_manifest(self) -> None:
+        """
+        Загрузка манифеста прошлых запусков и открытие его на дозапись
+
+        Строка манифеста: "ETag<TAB>ключ". Файл, ETag которого в источнике
+        не изменился, пропускается без HEAD-запроса.
+        """
+        if not self.manifest_path:
+            return
+
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, encoding='utf-8') as f:
+                for line in f:
+                    etag, sep, key = line.rstrip('\n').partition('\t')
+                    if sep:
+                        self.done[key] = etag
+            print(f"📒 В манифесте файлов: {len(self.done):,}")
+
+        self.manifest = open(self.manifest_path, 'a', encoding='utf-8')
+
+    def _mark_done(self, key: str, etag: str) -> None:
+        """Запись проверенного файла в манифест (буферизованная)"""
+        # Ключ с переводом строки не записать построчно - пропускаем
+        if self.manifest is None or '\n' in key:
+            return
+
+        self.manifest.write(f"{etag}\t{key}\n")
+        self.manifest_pending += 1
+        if self.manifest_pending >= MANIFEST_FLUSH_EVERY:
+            self.manifest.flush()
+            self.manifest_pending = 0
+
+    def _close_manifest(self) -> None:
+        """Сброс буфера и закрытие манифеста"""
+        if self.manifest is not None:
+            self.manifest.close()
+            self.manifest = None
+
+    def _same_content(self, source_etag: str, target_etag: str) -> bool:
+        """
+        Сравнение содержимого по ETag (при совпадающем размере)
+
+        ETag однокомпонентной загрузки - MD5 содержимого, его можно
+        сравнивать. ETag multipart-загрузки ("...-N") зависит от размера
+        частей, поэтому для него достаточно совпадения размера.
+        """
+        if not self.compare_etag or not source_etag or not target_etag:
+            return True
+        if '-' in source_etag or '-' in target_etag:
+            return True
+        return source_etag == target_etag
+
+    async def get_target_content_type(
         self,
         client,
-        key: str,
-        source_size: int
-    ) -> Tuple[bool, Optional[str]]:
+        key: str
+    ) -> Optional[str]:
         """
-        Проверка существования файла в целевом бакете
+        Получение MIME-типа файла в целевом бакете
 
         Returns:
-            Tuple[bool, Optional[str]]: (размер_совпадает, content_type)
+            Optional[str]: content_type или None, если файла нет
         """
+        response = await self._head_target(client, key)
+        if response is None:
+            return None
+        return response.get('ContentType', '')
+
+    async def _head_target(self, client, key: str) -> Optional[Dict]:
+        """HEAD файла в целевом бакете, None - если файла нет"""
         try:
-            response = await client.head_object(
+            return await client.head_object(
                 Bucket=self.target_bucket,
                 Key=key
             )
-            size_matches = response['ContentLength'] == source_size
-            current_content_type = response.get('ContentType', '')
-            return (size_matches, current_content_type)
         except ClientError as e:
-            if e.response['Error']['Code'] == '404':
-                return (False, None)
+            code = e.response['Error']['Code']
+            # Без s3:ListBucket хранилище отвечает 403 вместо 404
+            if code == '404' or (code == '403' and self.target_index is None):
+                return None
             raise
 
     async def copy_single_object(
         self,
         source_client,
         target_client,
-        obj: Dict
+        item: Tuple[str, int, str]
     ) -> Tuple[str, str]:
-        """Копирование одного объекта"""
-        if self.interrupted:
-            return (obj['Key'], 'interrupted')
-
-        key = obj['Key']
-        source_size = obj['Size']
+        """Копирование одного объекта (ключ, размер, ETag)"""
+        key = item[0]
+        loop = asyncio.get_running_loop()
+
+        for attempt in range(THROTTLE_RETRIES + 1):
+            # Пока хранилище троттлит - ждут все воркеры, а не каждый сам
+            delay = self.throttle_until - loop.time()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self.stop.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+            if self.stop.is_set():
+                return (key, 'interrupted')
 
-        async with self.semaphore:
             try:
-                # Определяем правильный MIME-тип по расширению
-                correct_type, _ = mimetypes.guess_type(key)
-                correct_type = (correct_type or 'application/octet-stream')
-
-                # Проверка существования и получение текущего MIME-типа
-                size_ok, current_type = await self.check_target_exists(
-                    target_client, key, source_size
+                status = await self._sync_object(
+                    source_client, target_client, item
                 )
+            except ClientError as e:
+                code = e.response['Error']['Code']
+                if code in THROTTLE_CODES and attempt < THROTTLE_RETRIES:
+                    self._throttle(code)
+                    continue
+                return (key, f"error: {code}")
+            except _Interrupted:
+                return (key, 'interrupted')
+            except Exception as e:
+                return (key, f"error: {str(e)}")
 
-                # Пропускаем только если размер И MIME-тип правильные
-                if size_ok and current_type:
-                    # Нормализуем для сравнения
-                    current_normalized = current_type.lower().strip()
-                    correct_normalized = correct_type.lower().strip()
-
-                    # Проверяем совпадение MIME-типа
-                    if current_normalized == correct_normalized:
-                        return (key, 'skipped')
-                    # Если MIME не совпадает - перезапишем с правильным
-
-                # Защита от больших файлов в памяти
-                if source_size > MAX_FILE_SIZE_IN_MEMORY:
-                    return await self._copy_large_file(
-                        source_client,
-                        target_client,
-                        key,
-                        correct_type
-                    )
+            return (key, status)
 
-                # Для маленьких файлов - обычное копирование
-                response = await source_client.get_object(
-                    Bucket=self.source_bucket,
-                    Key=key
-                )
+    def _throttle(self, code: str) -> None:
+        """Общая экспоненциальная пауза для всех воркеров"""
+        now = asyncio.get_running_loop().time()
+        if now < self.throttle_until:
+            # Пауза уже назначена другим воркером
+            return
 
-                # Читаем содержимое
-                body = await response['Body'].read()
+        # Уровень снижается вдвое за каждые THROTTLE_DECAY секунд без
+        # троттлинга: во время шторма отдельные успешные запросы
+        # не сбрасывают паузу обратно к 2 секундам
+        quiet = now - self.throttle_until
+        self.throttle_level >>= int(quiet // THROTTLE_DECAY)
+        # Выше уровня, на котором пауза упирается в MAX_BACKOFF, не растет
+        self.throttle_level = min(
+            self.throttle_level + 1,
+            MAX_BACKOFF.bit_length()
+        )
+        delay = min(MAX_BACKOFF, 2 ** self.throttle_level)
+        self.throttle_until = now + delay
+        self.log_queue.put_nowait(
+            f"⏸️  Хранилище ограничивает запросы ({code}), пауза {delay} с"
+        )
 
-                # Приоритет: правильный MIME из расширения
-                content_type = correct_type
+    async def _sync_object(
+        self,
+        source_client,
+        target_client,
+        item: Tuple[str, int, str]
+    ) -> str:
+        """Проверка и копирование объекта, возвращает статус"""
+        key, source_size, source_etag = item
+
+        head = None
+        if self.target_index is not None:
+            # Проверка существования по индексу целевого бакета
+            entry = self.target_index.get(key)
+        elif self.done.get(key) == source_etag:
+            # Листинг назначения недоступен: доверяем манифесту
+            return 'skipped'
+        else:
+            # Без листинга - HEAD, но мелкие файлы дешевле просто
+            # скопировать, чем проверять отдельным запросом
+            entry = None
+            if source_size >= self.skip_head_below:
+                head = await self._head_target(target_client, key)
+            if head is not None:
+                entry = (head['ContentLength'], head.get('ETag', ''))
+
+        size_ok = (
+            entry is not None
+            and entry[0] == source_size
+            and self._same_content(source_etag, entry[1])
+        )
+        if size_ok and not self.verify_content_type:
+            return 'skipped'
+
+        # Файл уже проверен или скопирован прошлым запуском
+        if size_ok and self.done.get(key) == source_etag:
+            return 'skipped'
+
+        # Определяем правильный MIME-тип по расширению
+        correct_type = _mime(key)
+
+        # Файл есть, но отличается: копируем с If-None-Match по его ETag,
+        # чтобы хранилище не передавало тело, если источник успел
+        # совпасть с ним. При неверном MIME условие не нужно - копируем всегда
+        if_none_match = entry[1] if entry is not None and not size_ok else ''
+
+        # HEAD нужен только для проверки MIME-типа
+        current_type = None
+        if size_ok and head is not None:
+            current_type = head.get('ContentType', '')
+        elif size_ok:
+            current_type = await self.get_target_content_type(
+                target_client, key
+            )
 
-                # Загружаем в целевой бакет с правильным MIME
-                await target_client.put_object(
-                    Bucket=self.target_bucket,
-                    Key=key,
-                    Body=body,
-                    ContentType=content_type,
-                    Metadata=response.get('Metadata', {})
+        # Пропускаем только если размер И MIME-тип правильные
+        if size_ok and current_type:
+            # Проверяем совпадение MIME-типа
+            # (correct_type уже нормализован)
+            if current_type.lower().strip() == correct_type:
+                self._mark_done(key, source_etag)
+                return 'skipped'
+            # Если MIME не совпадает - перезапишем с правильным
+
+        # Копирование делегировано s5cmd (S3RSYNC_ACCEL=s5cmd)
+        if self.accel is not None and self.server_side_copy:
+            await self._delegate_copy(key, source_etag, correct_type)
+            return 'delegated'
+
+        if self.server_side_copy:
+            try:
+                copied = await self._server_side_copy(
+                    source_client,
+                    target_client,
+                    key,
+                    source_size,
+                    correct_type,
+                    if_none_match
                 )
+                return self._copy_status(key, source_etag, copied)
+            except ClientError as e:
+                code = e.response['Error']['Code']
+                if code not in SERVER_COPY_UNSUPPORTED:
+                    raise
+                self._disable_server_side_copy(code)
+
+        # Потоковое копирование между разными хранилищами
+        copied = await self._stream_copy(
+            source_client,
+            target_client,
+            key,
+            source_size,
+            source_etag,
+            correct_type,
+            if_none_match
+        )
+        return self._copy_status(key, source_etag, copied)
 
-                # Очистка
-                del body
+    def _copy_status(self, key: str, etag: str, copied: bool) -> str:
+        """
+        Статус после копирования
 
-                return (key, 'copied')
+        copied=False - условие If-None-Match не выполнилось: источник
+        уже совпадает с назначением, передавать было нечего
+        """
+        if not copied:
+            return 'skipped'
+        self._mark_done(key, etag)
+        return 'copied'
+
+    async def _server_side_copy(
+        self,
+        source_client,
+        target_client,
+        key: str,
+        source_size: int,
+        content_type: str,
+        if_none_match: str = ''
+    ) -> bool:
+        """
+        Копирование внутри хранилища без передачи данных через клиента
 
+        if_none_match - ETag файла в назначении: если у источника тот же
+        ETag, копирования нет и возвращается False.
+        """
+        # Метаданные источника нужны для MetadataDirective='REPLACE'
+        head = await source_client.head_object(
+            Bucket=self.source_bucket,
+            Key=key
+        )
+        if if_none_match and head.get('ETag') == if_none_match:
+            return False
+        copy_source = {'Bucket': self.source_bucket, 'Key': key}
+        extra_args = {
+            'ContentType': content_type,
+            'MetadataDirective': 'REPLACE',
+        }
+        # Пустые метаданные не передаем - botocore не сериализует лишнее
+        if metadata := head.get('Metadata'):
+            extra_args['Metadata'] = metadata
+
+        if source_size < MULTIPART_COPY_THRESHOLD:
+            # MIME источника уже правильный - хранилище копирует
+            # все заголовки и метаданные как есть (MetadataDirective=COPY)
+            source_type = head.get('ContentType', '').lower().strip()
+            if source_type == content_type:
+                extra_args = {}
+            if if_none_match:
+                # Источник могут перезаписать между HEAD и копированием
+                extra_args['CopySourceIfNoneMatch'] = if_none_match
+            try:
+                await target_client.copy_object(
+                    Bucket=self.target_bucket,
+                    Key=key,
+                    CopySource=copy_source,
+                    **extra_args
+                )
             except ClientError as e:
-                return (key, f"error: {e.response['Error']['Code']}")
-            except Exception as e:
-                return (key, f"error: {str(e)}")
+                code = e.response['Error']['Code']
+                if if_none_match and code in COPY_NOT_MODIFIED_CODES:
+                    return False
+                raise
+            return True
+
+        # Крупные объекты (и обязательно >5 GB) - через TransferManager,
+        # который копирует части параллельно
+        config = TransferConfig(
+            multipart_threshold=MULTIPART_COPY_THRESHOLD,
+            multipart_chunksize=_part_size(source_size, self.part_size),
+            max_concurrency=self.part_concurrency,
+        )
+        await target_client.copy(
+            copy_source,
+            self.target_bucket,
+            key,
+            ExtraArgs=extra_args,
+            SourceClient=source_client,
+            Config=config
+        )
+        return True
 
-    async def _copy_large_file(
+    async def _stream_copy(
         self,
         source_client,
         target_client,
         key: str,
-        content_type: str
-    ) -> Tuple[str, str]:
-        """Копирование больших файлов (>10MB)"""
+        source_size: int,
+        source_etag: str,
+        content_type: str,
+        if_none_match: str = ''
+    ) -> bool:
+        """
+        Потоковое копирование через клиента
+
+        Маленькие файлы загружаются одним PUT, большие - частями через
+        multipart upload: каждая часть читается своим Range GET, поэтому
+        части скачиваются параллельно, а в памяти держится не больше
+        S3_PART_CONCURRENCY частей на объект. С if_none_match хранилище
+        отвечает 304 без тела, если источник совпадает с назначением -
+        тогда возвращается False.
+        """
+        if source_size <= MULTIPART_THRESHOLD:
+            conditions = (
+                {'IfNoneMatch': if_none_match} if if_none_match else {}
+            )
+            try:
+                response = await source_client.get_object(
+                    Bucket=self.source_bucket,
+                    Key=key,
+                    **conditions
+                )
+            except ClientError as e:
+                code = e.response['Error']['Code']
+                if if_none_match and code in NOT_MODIFIED_CODES:
+                    return False
+                raise
+            await target_client.put_object(
+                Bucket=self.target_bucket,
+                Key=key,
+                Body=await response['Body'].read(),
+                **self._stream_extra_args(response, content_type)
+            )
+            return True
+
+        # Средние файлы делятся между всеми загрузчиками (части не меньше
+        # 8 MB), крупные - на части S3_PART_SIZE_MB
+        per_uploader = -(-source_size // self.part_concurrency)
+        part_size = _part_size(
+            source_size,
+            min(self.part_size, max(CHUNK_SIZE, per_uploader))
+        )
+        # Метаданные для multipart upload - через HEAD: все части, включая
+        # первую, скачиваются только в бюджете памяти, и открытые ответы
+        # источника не простаивают в ожидании места. If-None-Match здесь
+        # не нужен: IfMatch по ETag из листинга уже отличает источник
+        # от назначения, а изменение источника - ошибка 412
+        conditions = {'IfMatch': source_etag} if source_etag else {}
+        head = await source_client.head_object(
+            Bucket=self.source_bucket,
+            Key=key,
+            **conditions
+        )
+        mpu = await target_client.create_multipart_upload(
+            Bucket=self.target_bucket,
+            Key=key,
+            **self._stream_extra_args(head, content_type)
+        )
+        upload_id = mpu['UploadId']
+
         try:
-            response = await source_client.get_object(
-                Bucket=self.source_bucket,
-                Key=key
+            parts = await self._upload_parts(
+                source_client,
+                target_client,
+                key,
+                upload_id,
+                source_size,
+                source_etag,
+                part_size
             )
-            body = await response['Body'].read()
 
-            await target_client.put_object(
+            await target_client.complete_multipart_upload(
                 Bucket=self.target_bucket,
                 Key=key,
-                Body=body,
-                ContentType=content_type,
-                Metadata=response.get('Metadata', {})
+                UploadId=upload_id,
+                MultipartUpload={'Parts': parts}
             )
+            return True
+        except (Exception, asyncio.CancelledError):
+            # Не оставляем незавершенных загрузок (за них берут плату)
+            try:
+                await target_client.abort_multipart_upload(
+                    Bucket=self.target_bucket,
+                    Key=key,
+                    UploadId=upload_id
+                )
+            except Exception:
+                pass
+            raise
 
-            del body
-            return (key, 'copied')
-        except Exception as e:
-            return (key, f"error: {str(e)}")
+    @staticmethod
+    def _stream_extra_args(response: Dict, content_type: str) -> Dict:
+        """Параметры загрузки: MIME-тип и метаданные источника"""
+        extra_args = {'ContentType': content_type}
+        # Пустые метаданные не передаем - botocore не сериализует лишнее
+        if metadata := response.get('Metadata'):
+            extra_args['Metadata'] = metadata
+        return extra_args
 
-    async def process_batch(
+    async def _get_range(
+        self,
+        source_client,
+        key: str,
+        etag: str,
+        start: int,
+        length: int
+    ) -> Dict:
+        """
+        Range GET части объекта
+
+        IfMatch гарантирует, что все части взяты из одной версии объекта,
+        даже если его перезапишут во время копирования.
+        """
+        conditions = {'IfMatch': etag} if etag else {}
+        return await source_client.get_object(
+            Bucket=self.source_bucket,
+            Key=key,
+            Range=f'bytes={start}-{start + length - 1}',
+            **conditions
+        )
+
+    @asynccontextmanager
+    async def _part_memory(self, size: int):
+        """
+        Резерв size байт из бюджета PART_MEMORY_LIMIT на время части
+
+        Единицы (по CHUNK_SIZE) набираются под part_lock: две части
+        не могут занять бюджет наполовину и ждать друг друга. Часть
+        больше всего бюджета занимает его целиком.
+        """
+        units = min(
+            PART_MEMORY_LIMIT // CHUNK_SIZE or 1,
+            -(-size // CHUNK_SIZE)
+        )
+        acquired = 0
+        try:
+            async with self.part_lock:
+                while acquired < units:
+                    await self.part_semaphore.acquire()
+                    acquired += 1
+            yield
+        finally:
+            for _ in range(acquired):
+                self.part_semaphore.release()
+
+    async def _upload_parts(
         self,
         source_client,
         target_client,
-        objects: List[Dict],
-        pbar
-    ) -> None:
-        """Обработка батча объектов через asyncio.gather"""
-        tasks = [
-            self.copy_single_object(source_client, target_client, obj)
-            for obj in objects
+        key: str,
+        upload_id: str,
+        source_size: int,
+        source_etag: str,
+        part_size: int
+    ) -> List[Dict]:
+        """
+        Параллельное копирование частей одного объекта
+
+        S3_PART_CONCURRENCY загрузчиков берут номера частей из общего
+        итератора, скачивают часть своим Range GET и сразу отправляют ее.
+        Общий бюджет PART_MEMORY_LIMIT ограничивает байты частей
+        в работе по всем объектам сразу.
+        """
+        numbers = iter(range(1, -(-source_size // part_size) + 1))
+        parts = []
+
+        async def uploader():
+            for part_number in numbers:
+                # При остановке новые части не начинаются: исключение
+                # ведет к abort_multipart_upload в _stream_copy
+                if self.stop.is_set():
+                    raise _Interrupted(key)
+                start = (part_number - 1) * part_size
+                length = min(part_size, source_size - start)
+                async with self._part_memory(length):
+                    response = await self._get_range(
+                        source_client, key, source_etag, start, length
+                    )
+                    body = response['Body']
+                    try:
+                        chunk = await _read_part(body, length)
+                    finally:
+                        body.close()
+                    if len(chunk) != length:
+                        raise IOError(
+                            f"часть {part_number}: получено {len(chunk)} "
+                            f"байт из {length}"
+                        )
+
+                    part = await target_client.upload_part(
+                        Bucket=self.target_bucket,
+                        Key=key,
+                        PartNumber=part_number,
+                        UploadId=upload_id,
+                        Body=chunk
+                    )
+                parts.append({'ETag': part['ETag'], 'PartNumber': part_number})
+
+        await _gather_or_cancel(
+            *(uploader() for _ in range(self.part_concurrency))
+        )
+
+        parts.sort(key=lambda part: part['PartNumber'])
+        return parts
+
+    async def _start_accel(self) -> None:
+        """
+        Запуск s5cmd для копирования (S3RSYNC_ACCEL=s5cmd)
+
+        Решение о пропуске, MIME-тип и манифест остаются за скриптом,
+        а сами CopyObject выполняет s5cmd, получая команды через stdin.
+        Работает только в режиме серверного копирования.
+        """
+        if os.getenv('S3RSYNC_ACCEL', '').lower() != 's5cmd':
+            return
+
+        binary = shutil.which('s5cmd')
+        if binary is None or not self.server_side_copy:
+            reason = 'не найден в PATH' if binary is None else (
+                'нужно серверное копирование'
+            )
+            print(f"⚠️  s5cmd не используется: {reason}")
+            return
+
+        args = [binary, '--json', '--numworkers', str(self.concurrency)]
+        if self.target_config.get('endpoint_url'):
+            args += ['--endpoint-url', self.target_config['endpoint_url']]
+        if self.target_config.get('verify') is False:
+            args.append('--no-verify-ssl')
+        args.append('run')
+
+        env = dict(os.environ)
+        env['AWS_ACCESS_KEY_ID'] = self.target_config['aws_access_key_id']
+        env['AWS_SECRET_ACCESS_KEY'] = (
+            self.target_config['aws_secret_access_key']
+        )
+        if self.target_config.get('region_name'):
+            env['AWS_REGION'] = self.target_config['region_name']
+
+        self.accel = await asyncio.create_subprocess_exec(
+            *args,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            env=env
+        )
+        self.accel_readers = [
+            asyncio.create_task(self._read_accel_output(self.accel.stdout)),
+            asyncio.create_task(self._read_accel_output(self.accel.stderr)),
         ]
+        print("🚀 Копирование делегировано s5cmd")
 
-        # Запускаем все задачи параллельно!
-        results = await asyncio.gather(*tasks, return_exceptions=True)
+    async def _delegate_copy(
+        self,
+        key: str,
+        etag: str,
+        content_type: str
+    ) -> None:
+        """Передача команды копирования в s5cmd"""
+        source = shlex.quote(f's3://{self.source_bucket}/{key}')
+        target = shlex.quote(f's3://{self.target_bucket}/{key}')
+        line = (
+            f'cp --raw --content-type {shlex.quote(content_type)} '
+            f'{source} {target}\n'
+        )
+        self.accel_pending[key] = etag
+        self.accel.stdin.write(line.encode())
+        await self.accel.stdin.drain()
 
-        for result in results:
-            if isinstance(result, Exception):
-                self.stats['errors'] += 1
-                tqdm.write(f"❌ Exception: {result}")
+    def _accel_key(self, result: Dict) -> str:
+        """
+        Ключ объекта из строки JSON-вывода s5cmd
+
+        В строках об успехе есть source и destination, а в строках
+        об ошибке - только command ("cp s3://src/key s3://dst/key", ключи
+        без кавычек), из которой ключ берется после последнего адреса
+        назначения.
+        """
+        target = f's3://{self.target_bucket}/'
+        source = f's3://{self.source_bucket}/'
+        if result.get('destination', '').startswith(target):
+            return result['destination'][len(target):]
+        if result.get('source', '').startswith(source):
+            return result['source'][len(source):]
+        _, found, key = result.get('command', '').rpartition(f' {target}')
+        return key if found else ''
+
+    async def _read_accel_output(self, stream) -> None:
+        """Разбор JSON-вывода s5cmd: статистика, прогресс и манифест"""
+        async for raw in stream:
+            line = raw.decode(errors='replace').strip()
+            if not line:
+                continue
+            try:
+                result = json.loads(line)
+            except ValueError:
+                self.log_queue.put_nowait(f"⚠️  s5cmd: {line}")
+                continue
+
+            key = self._accel_key(result)
+            etag = self.accel_pending.pop(key, None)
+            if result.get('success'):
+                if etag is not None:
+                    self._mark_done(key, etag)
+                self.stats['copied'] += 1
             else:
-                key, status = result
-                if status == 'copied':
-                    self.stats['copied'] += 1
-                elif status == 'skipped':
-                    self.stats['skipped'] += 1
-                elif status == 'interrupted':
-                    pass
-                else:
-                    self.stats['errors'] += 1
-                    tqdm.write(f"❌ {status}")
+                self.stats['errors'] += 1
+                self.log_queue.put_nowait(
+                    f"❌ {key}: error: {result.get('error')}"
+                )
+            self.processed += 1
 
-            pbar.update(1)
+    async def _finish_accel(self) -> None:
+        """Закрытие stdin s5cmd и ожидание завершения всех копирований"""
+        if self.accel is None:
+            return
+
+        self.accel.stdin.close()
+        await self.accel.stdin.wait_closed()
+        await asyncio.gather(*self.accel_readers)
+        await self.accel.wait()
+        self.accel = None
+
+    def _stop_accel(self) -> None:
+        """Остановка s5cmd при ошибке или прерывании"""
+        if self.accel is not None and self.accel.returncode is None:
+            self.accel.kill()
+        for reader in self.accel_readers:
+            reader.cancel()
+
+    def _disable_server_side_copy(self, code: str) -> None:
+        """Переключение на потоковое копирование до конца синхронизации"""
+        if self.server_side_copy:
+            self.server_side_copy = False
+            self.log_queue.put_nowait(
+                f"⚠️  Серверное копирование недоступно ({code}), "
+                "переключаюсь на потоковое"
+            )
+
+    async def _produce(self, client, queue: asyncio.Queue) -> None:
+        """
+        Листинг источника прямо в очередь копирования
 
-            if self.interrupted:
-                break
+        Копирование начинается с первой страницы, а в памяти держится
+        только очередь из компактных (ключ, размер, ETag), а не весь список.
+        """
+        self.log_queue.put_nowait(
+            f"📋 Получение списка файлов из {self.source_bucket}..."
+        )
+
+        async for contents in self._iter_pages(client, self.source_bucket):
+            for obj in contents:
+                if self.stop.is_set():
+                    break
+                await queue.put(
+                    (obj['Key'], obj['Size'], obj.get('ETag', ''))
+                )
+                self.stats['total'] += 1
+
+        self.log_queue.put_nowait(
+            f"✅ Найдено файлов: {self.stats['total']:,}"
+        )
+
+        for _ in range(self.concurrency):
+            await queue.put(None)
+
+    async def _worker(
+        self,
+        source_client,
+        target_client,
+        queue: asyncio.Queue
+    ) -> None:
+        """Воркер: копирует объекты из очереди, пока не получит None"""
+        await self.target_indexed.wait()
+
+        # Горячий цикл: атрибуты связываем с локальными именами один раз
+        copy = self.copy_single_object
+        stats = self.stats
+        get = queue.get
+
+        while (item := await get()) is not None:
+            # copy_single_object не выбрасывает исключений:
+            # ошибки приходят статусом 'error: ...'
+            key, status = await copy(source_client, target_client, item)
+            if status == 'delegated':
+                # Итог по файлу придет из вывода s5cmd
+                continue
+            if status in stats:
+                stats[status] += 1
+            elif status != 'interrupted':
+                stats['errors'] += 1
+                self.log_queue.put_nowait(f"❌ {status}")
+
+            # Прогресс-бар обновляется пачками в _report_progress
+            self.processed += 1
+
+    async def _report_progress(self, pbar) -> None:
+        """Периодическое обновление прогресс-бара и вывод сообщений"""
+        while True:
+            await asyncio.sleep(PROGRESS_INTERVAL)
+            self._flush_progress(pbar)
+
+    def _flush_progress(self, pbar) -> None:
+        """Вывод накопленных сообщений и продвижение прогресс-бара"""
+        # tqdm.write стирает и перерисовывает бар на каждый вызов,
+        # поэтому сообщения выводятся пачками
+        lines = []
+        while not self.log_queue.empty():
+            lines.append(self.log_queue.get_nowait())
+        for start in range(0, len(lines), LOG_BATCH):
+            tqdm.write('\n'.join(lines[start:start + LOG_BATCH]))
+        # Общее число растет по мере листинга источника
+        if pbar.total != self.stats['total']:
+            pbar.total = self.stats['total']
+            pbar.refresh()
+        pbar.update(self.processed - pbar.n)
 
     async def sync(self):
         """Основной метод синхронизации"""
-        # Создаем семафор
-        self.semaphore = asyncio.Semaphore(self.concurrency)
+        # Создаем семафор и событие готовности индекса назначения
+        # Части в памяти ограничены PART_MEMORY_LIMIT байт по всем объектам
+        # (при частях больше лимита - одна часть за раз)
+        self.part_semaphore = asyncio.Semaphore(
+            max(1, PART_MEMORY_LIMIT // CHUNK_SIZE)
+        )
+        self.part_lock = asyncio.Lock()
+        self.target_indexed = asyncio.Event()
+        self._setup_signal_handlers()
 
         print("🚀 Начало синхронизации")
         print(f"📤 Источник: {self.source_bucket}")
         print(f"📥 Назначение: {self.target_bucket}")
-        print(f"⚡ Параллельных операций: {self.concurrency}\n")
-
-        # Получаем список объектов
-        objects = await self.get_all_objects()
-
-        if not objects:
-            print("ℹ️  Нет файлов для копирования")
-            return
+        print(f"⚡ Параллельных операций: {self.concurrency}")
+        mode = 'серверное' if self.server_side_copy else 'потоковое'
+        print(f"🔁 Копирование: {mode}\n")
 
-        self.stats['total'] = len(objects)
+        self._load_manifest()
+        await self._start_accel()
 
-        print("\n📦 Копирование файлов...")
+        print("📦 Копирование файлов...")
 
         # Открываем оба клиента один раз
         async with self.session.client('s3', **self.source_config) as src:
             async with self.session.client('s3', **self.target_config) as tgt:
 
-                # Обрабатываем батчами для лучшего управления памятью
-                # Батч = MAX_WORKERS × 3 для баланса памяти/скорости
-                batch_size = self.concurrency * 3
-
-                with tqdm(total=len(objects), unit='файл') as pbar:
-                    for i in range(0, len(objects), batch_size):
-                        if self.interrupted:
-                            break
-
-                        batch = objects[i:i + batch_size]
-                        await self.process_batch(src, tgt, batch, pbar)
+                # Конвейер: листинг источника кладет объекты в очередь,
+                # MAX_WORKERS постоянных воркеров копируют их, не дожидаясь
+                # конца листинга. Размер очереди ограничивает память
+                queue = asyncio.Queue(maxsize=self.concurrency * 2)
+
+                with tqdm(
+                    total=0,
+                    unit='файл',
+                    mininterval=PROGRESS_INTERVAL,
+                    smoothing=0
+                ) as pbar:
+                    reporter = asyncio.create_task(
+                        self._report_progress(pbar)
+                    )
+                    workers = [
+                        self._worker(src, tgt, queue)
+                        for _ in range(self.concurrency)
+                    ]
+                    try:
+                        await _gather_or_cancel(
+                            self._index_target(tgt),
+                            self._produce(src, queue),
+                            *workers
+                        )
+                        await self._finish_accel()
+                    finally:
+                        self._stop_accel()
+                        reporter.cancel()
+                        self._flush_progress(pbar)
+                        self._close_manifest()
+
+        if not self.stats['total']:
+            print("ℹ️  Нет файлов для копирования")
+            return
 
         self._print_summary()
 
@@ -345,7 +1314,7 @@ class S3Syncer:
         print(f"⏭️  Пропущено:      {self.stats['skipped']:,}")
         print(f"❌ Ошибок:         {self.stats['errors']:,}")
 
-        if self.interrupted:
+        if self.stop.is_set():
             processed = sum([
                 self.stats['copied'],
                 self.stats['skipped'],
@@ -357,7 +1326,7 @@ class S3Syncer:
 
         print("=" * 60 + "\n")
 
-        if self.interrupted:
+        if self.stop.is_set():
             print("⚠️  Синхронизация прервана")
         elif self.stats['errors'] > 0:
             print("⚠️  Завершено с ошибками")
@@ -379,4 +1348,7 @@ async def main():
 
 
 if __name__ == '__main__':
-    asyncio.run(main())
+    if uvloop is not None:
+        uvloop.run(main())
+    else:
+        asyncio.run(main())